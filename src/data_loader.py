@@ -1,16 +1,43 @@
 # src/data_loader.py
 """
 Funciones para cargar CSVs robustamente:
-- load_csv_smart: intenta detectar separador, distintos encodings y usa fallback.
+- load_csv_smart: detecta encoding y separador (csv.Sniffer), una sola lectura y fallback.
+- to_categoricals: pasa a dtype `category` las columnas de texto de baja cardinalidad.
 """
 
 import pandas as pd
 import io
-import chardet
+import csv
+import codecs
 
-def detect_encoding(path_or_bytes, nbytes=4096):
+_BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+def _detect_with_backend(data) -> str:
+    """
+    Detección "lenta": cchardet (C) si está instalado, si no chardet (dependencia declarada)
+    y solo como último recurso charset-normalizer (confunde Latin-1 con cp852/windows-1250).
+    """
+    try:
+        import cchardet as detector
+    except ImportError:
+        try:
+            import chardet as detector
+        except ImportError:
+            import charset_normalizer as detector
+    res = detector.detect(bytes(data))
+    return res.get("encoding") or "utf-8"
+
+def detect_encoding(path_or_bytes, nbytes=65536):
     """
-    Detecta encoding usando chardet sobre los primeros nbytes.
+    Detecta encoding sobre los primeros nbytes.
+    Caminos rápidos: BOM y UTF-8 válido (ASCII incluido) se resuelven sin detector;
+    solo en otro caso se usa cchardet/chardet/charset-normalizer.
     path_or_bytes: ruta (str) o bytes-like (uploaded file)
     """
     data = None
@@ -24,36 +51,104 @@ def detect_encoding(path_or_bytes, nbytes=4096):
         # assume path
         with open(path_or_bytes, "rb") as f:
             data = f.read(nbytes)
-    res = chardet.detect(data)
-    return res.get("encoding", "utf-8")
+    for bom, enc in _BOMS:
+        if data.startswith(bom):
+            return enc
+    try:
+        # final=False: no falla si la muestra corta un carácter multibyte al final
+        codecs.getincrementaldecoder("utf-8")().decode(data, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    return _detect_with_backend(data)
+
+def _sniff_sep(sample: str, default: str = ",") -> str:
+    """
+    Elige el separador con csv.Sniffer sobre una muestra de texto (una sola pasada).
+    """
+    # descartar la última línea (probablemente cortada) para no confundir al sniffer
+    cut = sample.rfind("\n")
+    if cut > 0:
+        sample = sample[:cut]
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t|").delimiter
+    except csv.Error:
+        return default
 
-def load_csv_smart(path_or_buffer):
+def _read_csv(make_source, sep: str, enc: str, arrow_dtypes: bool = False) -> pd.DataFrame:
+    """
+    Una única lectura con el separador elegido. Si pyarrow está instalado usa su motor
+    (multihilo; o el motor C si falla). Con arrow_dtypes=True devuelve además columnas
+    respaldadas por Arrow (dtype_backend="pyarrow"); por defecto no, porque pd.NA en esas
+    columnas rompe librerías que esperan dtypes numpy (p. ej. plotly con color=).
+    make_source: callable que devuelve una fuente nueva (path o BytesIO) por intento.
+    """
+    backend = {"dtype_backend": "pyarrow"} if arrow_dtypes else {}
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return pd.read_csv(make_source(), sep=sep, encoding=enc, engine="c", low_memory=False)
+    try:
+        return pd.read_csv(make_source(), sep=sep, encoding=enc, engine="pyarrow", **backend)
+    except Exception:
+        return pd.read_csv(make_source(), sep=sep, encoding=enc, engine="c", low_memory=False, **backend)
+
+def _read_all(f) -> bytes:
+    """Lee todo el contenido de un archivo abierto y restaura su posición (si admite seek)."""
+    try:
+        pos = f.tell()
+    except (AttributeError, OSError):
+        return f.read()
+    data = f.read()
+    f.seek(pos)
+    return data
+
+def load_csv_smart(path_or_buffer, sample_size: int = 32768, arrow_dtypes: bool = False):
     """
     Carga CSV desde:
-    - uploaded file-like (streamlit's UploadedFile)
+    - uploaded file-like (streamlit's UploadedFile) o cualquier archivo abierto (con .read())
+    - bytes (p. ej. UploadedFile.getvalue(), útil como clave de cache)
     - path string
-    Intenta distintos separadores y encodings.
+    Detecta encoding y separador (csv.Sniffer sobre los primeros sample_size bytes)
+    y hace una sola lectura; si falla, reintenta con el motor de Python salteando
+    (con warning) las filas mal formadas.
+    arrow_dtypes: opt-in, devuelve columnas respaldadas por Arrow si pyarrow está instalado.
     """
-    # Si es file-like (UploadedFile), obtener bytes
-    if hasattr(path_or_buffer, "getvalue"):
-        raw = path_or_buffer.getvalue()
+    # Si es file-like (UploadedFile, archivo abierto) o bytes, trabajar sobre los bytes
+    if isinstance(path_or_buffer, (bytes, bytearray)) or hasattr(path_or_buffer, "getvalue") or hasattr(path_or_buffer, "read"):
+        if isinstance(path_or_buffer, (bytes, bytearray)):
+            raw = path_or_buffer
+        elif hasattr(path_or_buffer, "getvalue"):
+            raw = path_or_buffer.getvalue()
+        else:
+            raw = _read_all(path_or_buffer)
+        if isinstance(raw, str):
+            # archivo abierto en modo texto: ya está decodificado
+            raw = raw.encode("utf-8")
         enc = detect_encoding(raw)
-        # intentar sniffer simple
-        for sep in [",", ";", "\t", "|"]:
-            try:
-                df = pd.read_csv(io.BytesIO(raw), sep=sep, encoding=enc, low_memory=False)
-                return df
-            except Exception:
-                continue
-        # fallback: pandas autodetect
-        return pd.read_csv(io.BytesIO(raw), low_memory=False)
+        head = raw[:sample_size]
+        make_source = lambda: io.BytesIO(raw)
     else:
         # path
         enc = detect_encoding(path_or_buffer)
-        for sep in [",", ";", "\t", "|"]:
-            try:
-                df = pd.read_csv(path_or_buffer, sep=sep, encoding=enc, low_memory=False)
-                return df
-            except Exception:
-                continue
-        return pd.read_csv(path_or_buffer, low_memory=False)
+        with open(path_or_buffer, "rb") as f:
+            head = f.read(sample_size)
+        make_source = lambda: path_or_buffer
+    sep = _sniff_sep(head.decode(enc, errors="replace"))
+    try:
+        return _read_csv(make_source, sep, enc, arrow_dtypes)
+    except Exception:
+        # fallback: mismo encoding y separador, pero tolerante a filas con campos de más
+        return pd.read_csv(make_source(), sep=sep, encoding=enc, engine="python", on_bad_lines="warn")
+
+def to_categoricals(df: pd.DataFrame, max_unique: int = 200) -> pd.DataFrame:
+    """
+    Convierte a `category` (in place) las columnas de texto con pocos valores distintos
+    (<= max(max_unique, len(df) // 50)). Filtros con isin y groupby pasan a operar
+    sobre códigos enteros en lugar de strings.
+    """
+    limit = max(max_unique, len(df) // 50)
+    for c in df.select_dtypes(include=["object", "string"]).columns:
+        if df[c].nunique(dropna=True) <= limit:
+            df[c] = df[c].astype("category")
+    return df
@@ -6,12 +6,26 @@ Nodo: "col::valor" para evitar colisiones entre columnas.
 
 import networkx as nx
 import pandas as pd
+import numpy as np
+import os
+from concurrent.futures import ThreadPoolExecutor
 from itertools import combinations
 from typing import List
 
 def node_id(col: str, val) -> str:
     return f"{col}::" + str(val)
 
+def _pair_counts(a: np.ndarray, b: np.ndarray, ids_a: np.ndarray, ids_b: np.ndarray):
+    """
+    Cuenta co-ocurrencias entre dos columnas codificadas (-1 = NaN) empaquetando
+    (código_a, código_b) en una sola clave int64 y contando con np.unique
+    (sin iterar filas ni buscar en dicts). Devuelve (u_ids, v_ids, pesos).
+    """
+    mask = (a >= 0) & (b >= 0)
+    K = len(ids_b)
+    keys, counts = np.unique(a[mask] * K + b[mask], return_counts=True)
+    return ids_a[keys // K], ids_b[keys % K], counts
+
 def build_cooccurrence_graph(df: pd.DataFrame, cols: List[str], min_count: int = 1) -> nx.Graph:
     """
     Construye grafo de co-ocurrencias.
@@ -20,22 +34,32 @@ def build_cooccurrence_graph(df: pd.DataFrame, cols: List[str], min_count: int =
     - min_count: filtra aristas con peso < min_count (post-build)
     """
     G = nx.Graph()
-    # añadir nodos
+    # códigos enteros por columna (-1 = NaN) y tabla código -> node_id
+    codes = {}
+    ids = {}
     for col in cols:
-        unique_vals = df[col].dropna().unique()
-        for v in unique_vals:
-            G.add_node(node_id(col, v), label=str(v), column=col)
+        cat = df[col].astype("category").cat
+        # categorías distintas con el mismo str (p. ej. 1 y "1") son el mismo nodo:
+        # se unifican y se remapean los códigos (el -1 agregado al final conserva los NaN)
+        remap, labels = pd.factorize(np.array([str(v) for v in cat.categories], dtype=object))
+        codes[col] = np.append(remap, -1).astype(np.int64)[cat.codes.to_numpy()]
+        ids[col] = np.array([node_id(col, v) for v in labels], dtype=object)
+        # añadir nodos: solo categorías presentes, en orden de aparición
+        present = pd.unique(codes[col][codes[col] >= 0])
+        G.add_nodes_from((ids[col][k], {"label": labels[k], "column": col}) for k in present)
 
-    # iterar filas; recomendable filtrar df previamente si es muy grande
-    for idx, row in df[cols].dropna(how="all").iterrows():
-        items = [(c, row[c]) for c in cols if pd.notna(row[c])]
-        for (c1, v1), (c2, v2) in combinations(items, 2):
-            u = node_id(c1, v1)
-            v = node_id(c2, v2)
-            if G.has_edge(u, v):
-                G[u][v]["weight"] += 1
-            else:
-                G.add_edge(u, v, weight=1)
+    # contar co-ocurrencias por par de columnas; los pares son independientes y np.unique
+    # (ordenamiento numérico) libera el GIL, así que se reparten en hilos
+    tasks = [(codes[c1], codes[c2], ids[c1], ids[c2]) for c1, c2 in combinations(cols, 2)]
+    if len(tasks) > 1:
+        with ThreadPoolExecutor(max_workers=min(len(tasks), os.cpu_count() or 1)) as pool:
+            results = list(pool.map(lambda t: _pair_counts(*t), tasks))
+    else:
+        results = [_pair_counts(*t) for t in tasks]
+    results = [r for r in results if len(r[2])]
+    if results:
+        u_arr, v_arr, w_arr = (np.concatenate(parts) for parts in zip(*results))
+        G.add_weighted_edges_from(zip(u_arr, v_arr, w_arr.tolist()))
 
     # opcional: remover aristas de bajo peso
     if min_count > 1:
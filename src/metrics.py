@@ -2,129 +2,302 @@
 """
 Cálculo de métricas de grafo optimizadas:
 - degree, degree_weighted, degree_centrality
-- betweenness (aprox por muestreo si el grafo es grande)
-- eigenvector (usar sparse ARPACK cuando posible)
+- betweenness: exacta con igraph; aprox por muestreo si el grafo es grande (NetworKit -> igraph -> networkx)
+- eigenvector (power-iteration sobre CSR; eigsh como fallback)
 - detección de comunidades (igraph -> python-louvain -> networkx greedy)
+Las tres últimas son independientes y, si se pide (parallel_min_nodes), se calculan en procesos separados.
 """
 
+import os
 import time
 import math
+import random
 from typing import Tuple
 import networkx as nx
 import pandas as pd
 import numpy as np
 
-def compute_graph_metrics(
-    G: nx.Graph,
-    approx_betweenness: bool = True,
-    bet_k: int = None,
-    max_nodes_for_exact: int = 2000
-) -> Tuple[pd.DataFrame, pd.DataFrame]:
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _spmv_power_numba(indptr, indices, data, max_iter, tol):
+        """Power-iteration sobre (A + I) en CSR, SpMV compilada. Devuelve (x, convergió)."""
+        n = indptr.shape[0] - 1
+        x = np.full(n, 1.0 / n)
+        y = np.empty(n)
+        for _ in range(max_iter):
+            for i in range(n):
+                s = x[i]
+                for k in range(indptr[i], indptr[i + 1]):
+                    s += data[k] * x[indices[k]]
+                y[i] = s
+            nrm = 0.0
+            for i in range(n):
+                nrm += y[i] * y[i]
+            nrm = math.sqrt(nrm)
+            if nrm == 0.0:
+                return x, True
+            diff = 0.0
+            for i in range(n):
+                y[i] /= nrm
+                diff += abs(y[i] - x[i])
+            x, y = y, x
+            if diff < n * tol:
+                return x, True
+        return x, False
+else:
+    _spmv_power_numba = None
+
+def _power_iteration(A, max_iter: int = 100, tol: float = 1e-6):
     """
-    Retorna nodes_df y edges_df con métricas.
-    - approx_betweenness: si True calcula aproximación cuando G es grande
-    - bet_k: número de fuentes para aproximación (None -> auto)
+    Vector propio dominante de A (simétrica, no negativa) por power-iteration.
+    Itera sobre A + I para evitar la oscilación en grafos bipartitos.
+    Usa el kernel numba sobre indptr/indices/data si numba está instalado.
+    Devuelve None si no converge.
     """
-    tstart = time.time()
-    n_nodes = G.number_of_nodes()
-    # degree y degree_weighted
-    degree = dict(G.degree())
-    degree_w = dict(G.degree(weight="weight"))
-    if n_nodes > 1:
-        degree_centrality = {n: d / (n_nodes - 1) for n, d in degree.items()}
+    n = A.shape[0]
+    if _spmv_power_numba is not None:
+        x, converged = _spmv_power_numba(A.indptr, A.indices, A.data, max_iter, tol)
+        return x if converged else None
+    x = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        y = A @ x + x
+        nrm = np.linalg.norm(y)
+        if nrm == 0:
+            return x
+        y /= nrm
+        if np.abs(y - x).sum() < n * tol:
+            return y
+        x = y
+    return None
+
+def _igraph_from_csr(A):
+    """
+    Grafo igraph (núcleo en C) a partir del triángulo superior de la adyacencia CSR.
+    """
+    import igraph as ig
+    import scipy.sparse as sp
+    upper = sp.triu(A, format="coo")
+    g_ig = ig.Graph(n=A.shape[0], edges=list(zip(upper.row.tolist(), upper.col.tolist())), directed=False)
+    if upper.data.any():
+        g_ig.es["weight"] = upper.data.astype(np.float64).tolist()
+    return g_ig
+
+def _igraph_betweenness(g_ig, k: int = None, seed: int = 42) -> np.ndarray:
+    """
+    Betweenness normalizada (misma escala que networkx) usando igraph.
+    Si k no es None, estima con k fuentes muestreadas y reescala por n/k.
+    """
+    n = g_ig.vcount()
+    weights = "weight" if "weight" in g_ig.es.attributes() else None
+    if k is None or k >= n:
+        values = g_ig.betweenness(directed=False, weights=weights)
+        scale = 1.0
     else:
-        degree_centrality = {n: 0.0 for n in G.nodes()}
+        sources = random.Random(seed).sample(range(n), k)
+        values = g_ig.betweenness(directed=False, weights=weights, sources=sources)
+        scale = n / k
+    if n > 2:
+        scale *= 2.0 / ((n - 1) * (n - 2))
+    return np.asarray(values, dtype=np.float64) * scale
 
-    # betweenness (exacta o aproximada)
-    if bet_k is None:
-        if approx_betweenness and n_nodes > max_nodes_for_exact:
-            k = int(min(500, max(50, math.sqrt(n_nodes) * 10)))
-        else:
-            k = None
+def _networkit_betweenness(A, k: int = None, epsilon: float = None, seed: int = 42) -> np.ndarray:
+    """
+    Betweenness aproximada (normalizada) con los samplers paralelos en C++ de NetworKit:
+    EstimateBetweenness con k muestras o, si se pide epsilon, ApproxBetweenness
+    (Riondato-Kornaropoulos: error aditivo <= epsilon con probabilidad 0.9).
+    El muestreo usa semilla fija, igual que los fallbacks (resultados reproducibles).
+    """
+    import networkit as nk
+    import scipy.sparse as sp
+    upper = sp.triu(A, format="coo")
+    G_nk = nk.Graph(A.shape[0], weighted=True, directed=False)
+    G_nk.addEdges((upper.data.astype(np.float64), (upper.row.astype(np.uint64), upper.col.astype(np.uint64))))
+    if epsilon is not None:
+        bc = nk.centrality.ApproxBetweenness(G_nk, epsilon=epsilon, delta=0.1)
     else:
-        k = bet_k
+        bc = nk.centrality.EstimateBetweenness(G_nk, k, normalized=True, parallel=True)
+    nk.setSeed(seed, False)
+    bc.run()
+    return np.asarray(bc.scores(), dtype=np.float64)
 
+# Las tres métricas siguientes son independientes entre sí: reciben la adyacencia CSR
+# (barata de serializar, a diferencia del nx.Graph) y devuelven un array en el orden de
+# sus filas, así pueden correr en procesos separados.
+
+def _betweenness_from_csr(A, k: int = None, epsilon: float = None) -> np.ndarray:
+    """
+    Betweenness exacta si k es None, si no aproximada con k fuentes.
+    Aproximada: NetworKit -> igraph -> networkx; exacta: igraph -> networkx.
+    """
+    n = A.shape[0]
+    if k is not None or epsilon is not None:
+        try:
+            return _networkit_betweenness(A, k=k, epsilon=epsilon)
+        except Exception:
+            pass
+    try:
+        return _igraph_betweenness(_igraph_from_csr(A), k=k)
+    except Exception:
+        pass
+    H = nx.from_scipy_sparse_array(A)
     if k is None:
         # exact (puede tardar en grafos grandes)
-        bet = nx.betweenness_centrality(G, weight="weight")
+        bet = nx.betweenness_centrality(H, weight="weight")
     else:
         # aproximada
         try:
-            bet = nx.betweenness_centrality(G, k=k, weight="weight", seed=42)
+            bet = nx.betweenness_centrality(H, k=k, weight="weight", seed=42)
         except TypeError:
             # versión antigua de networkx: fallback a exact (advertir)
-            bet = nx.betweenness_centrality(G, weight="weight")
+            bet = nx.betweenness_centrality(H, weight="weight")
+    return np.fromiter((bet.get(i, 0.0) for i in range(n)), dtype=np.float64, count=n)
 
-    # eigenvector con sparse si es posible
-    eig = {}
+def _eigenvector_from_csr(A) -> np.ndarray:
+    """Eigenvector (normalizado a suma 1): power-iteration sobre CSR (sin ARPACK); eigsh si no converge."""
+    n = A.shape[0]
+    if n == 0:
+        return np.zeros(0)
+    if n == 1:
+        return np.ones(1)
     try:
-        import scipy.sparse as sp
-        from scipy.sparse.linalg import eigs, ArpackNoConvergence
-        nodes = list(G.nodes())
-        A = nx.to_scipy_sparse_matrix(G, nodelist=nodes, weight="weight", format="csr", dtype=float)
-        if A.shape[0] == 0:
-            eig = {n: 0.0 for n in nodes}
-        elif A.shape[0] == 1:
-            eig = {nodes[0]: 1.0}
-        else:
-            vals, vecs = eigs(A, k=1, which="LM", maxiter=200)
-            vec = np.real(vecs[:, 0])
-            vec = np.abs(vec)
-            if vec.sum() != 0:
-                vec = vec / vec.sum()
-            eig = {nodes[i]: float(vec[i]) for i in range(len(nodes))}
+        vec = _power_iteration(A)
+        if vec is None:
+            from scipy.sparse.linalg import eigsh
+            vals, vecs = eigsh(A, k=1, which="LA", maxiter=200)
+            vec = np.abs(vecs[:, 0])
+        vec = vec.astype(np.float64)
     except Exception:
         # fallback a networkx power method
         try:
-            eig = nx.eigenvector_centrality(G, max_iter=200)
+            ev = nx.eigenvector_centrality(nx.from_scipy_sparse_array(A), max_iter=200)
+            vec = np.fromiter((ev.get(i, 0.0) for i in range(n)), dtype=np.float64, count=n)
         except Exception:
-            eig = {n: 0.0 for n in G.nodes()}
+            return np.zeros(n)
+    if vec.sum() != 0:
+        vec = vec / vec.sum()
+    return vec
 
-    # comunidades: preferir igraph -> python-louvain -> greedy
-    node_community = {}
+def _communities_from_csr(A) -> np.ndarray:
+    """Comunidades: preferir igraph -> python-louvain -> greedy; -1 si ninguna funciona."""
+    n = A.shape[0]
+    community = np.full(n, -1, dtype=np.int64)
     try:
-        import igraph as ig
-        nodes = list(G.nodes())
-        idx = {n: i for i, n in enumerate(nodes)}
-        edges = [(idx[u], idx[v]) for u, v in G.edges()]
-        weights = [d.get("weight", 1) for _, _, d in G.edges(data=True)]
-        g_ig = ig.Graph(edges=edges, directed=False)
-        if any(weights):
-            g_ig.es["weight"] = weights
+        g_ig = _igraph_from_csr(A)
         cl = g_ig.community_multilevel(weights=g_ig.es["weight"] if "weight" in g_ig.es.attributes() else None)
-        for cid, comm in enumerate(cl):
-            for vid in comm:
-                node_community[nodes[vid]] = int(cid)
+        community[:] = cl.membership
+        return community
     except Exception:
+        pass
+    H = nx.from_scipy_sparse_array(A)
+    try:
+        import community as community_louvain
+        part = community_louvain.best_partition(H, weight="weight")
+        for i, c in part.items():
+            community[i] = int(c)
+    except Exception:
+        try:
+            from networkx.algorithms import community as nx_comm
+            comms = list(nx_comm.greedy_modularity_communities(H, weight="weight"))
+            for cid, comm in enumerate(comms):
+                for i in comm:
+                    community[i] = cid
+        except Exception:
+            pass
+    return community
+
+def _run_tasks(tasks: dict, parallel: bool) -> dict:
+    """
+    Ejecuta {nombre: (func, args)} y devuelve {nombre: resultado}.
+    En paralelo usa un proceso por tarea, limitado a os.cpu_count() (evita el GIL de los
+    fallbacks en Python); con menos de 2 núcleos no hay nada que ganar y corre serial.
+    Si el pool falla (p. ej. entorno sin fork/spawn utilizable) cae a ejecución serial.
+    Usa el método de arranque por defecto de la plataforma; donde es "spawn" (Windows,
+    macOS) los hijos re-importan el __main__ del llamador, que debe proteger su código
+    con `if __name__ == "__main__":`.
+    """
+    workers = min(len(tasks), os.cpu_count() or 1)
+    if parallel and workers >= 2:
         try:
-            import community as community_louvain
-            part = community_louvain.best_partition(G, weight="weight")
-            node_community = {n: int(c) for n, c in part.items()}
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+            results = {}
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(func, *args): name for name, (func, args) in tasks.items()}
+                for fut in as_completed(futures):
+                    results[futures[fut]] = fut.result()
+            return results
         except Exception:
-            try:
-                from networkx.algorithms import community as nx_comm
-                comms = list(nx_comm.greedy_modularity_communities(G, weight="weight"))
-                for i, comm in enumerate(comms):
-                    for n in comm:
-                        node_community[n] = int(i)
-            except Exception:
-                node_community = {n: -1 for n in G.nodes()}
-
-    # armar DataFrames
-    nodes_data = []
-    for n, d in G.nodes(data=True):
-        nodes_data.append({
-            "node_id": n,
-            "label": d.get("label"),
-            "column": d.get("column"),
-            "degree": int(degree.get(n, 0)),
-            "degree_weighted": float(degree_w.get(n, 0)),
-            "degree_centrality": float(degree_centrality.get(n, 0)),
-            "betweenness": float(bet.get(n, 0)),
-            "eigenvector": float(eig.get(n, 0)),
-            "community": int(node_community.get(n, -1))
-        })
-    nodes_df = pd.DataFrame(nodes_data).sort_values("degree_weighted", ascending=False)
+            pass
+    return {name: func(*args) for name, (func, args) in tasks.items()}
+
+def compute_graph_metrics(
+    G: nx.Graph,
+    approx_betweenness: bool = True,
+    bet_k: int = None,
+    max_nodes_for_exact: int = 2000,
+    parallel_min_nodes: int = None,
+    bet_epsilon: float = None
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Retorna nodes_df y edges_df con métricas.
+    - approx_betweenness: si True calcula aproximación cuando G es grande
+    - bet_k: número de fuentes para aproximación (None -> auto)
+    - bet_epsilon: si se indica (y NetworKit está instalado) usa ApproxBetweenness con ese
+      error aditivo máximo en lugar de muestrear bet_k fuentes
+    - parallel_min_nodes: opt-in; desde este tamaño betweenness/eigenvector/comunidades
+      corren en procesos separados (None -> siempre serial). Valores útiles rondan los
+      20000 nodos: por debajo, el arranque de los procesos cuesta más de lo que se gana.
+      En plataformas con "spawn" el script llamador necesita `if __name__ == "__main__":`
+    """
+    tstart = time.time()
+    n_nodes = G.number_of_nodes()
+    # orden de nodos compartido por todas las métricas (filas/columnas de A)
+    nodes = list(G.nodes())
+    # adyacencia CSR construida una sola vez y compartida (float32: SpMV es memory-bound)
+    A = nx.to_scipy_sparse_array(G, nodelist=nodes, weight="weight", format="csr", dtype=np.float32)
+    # degree, degree_weighted y degree_centrality en una sola pasada sobre A (sin recorrer G):
+    # grado = nº de entradas por fila (indptr), grado ponderado = suma por fila
+    degree = np.diff(A.indptr).astype(np.int64)
+    degree_w = np.asarray(A.sum(axis=1, dtype=np.float64)).ravel()
+    degree_centrality = degree / (n_nodes - 1) if n_nodes > 1 else np.zeros(n_nodes)
+
+    # betweenness (exacta o aproximada)
+    if bet_k is None:
+        if approx_betweenness and n_nodes > max_nodes_for_exact:
+            k = int(min(500, max(50, math.sqrt(n_nodes) * 10)))
+        else:
+            k = None
+    else:
+        k = bet_k
+
+    # betweenness, eigenvector y comunidades son independientes: en grafos grandes en paralelo
+    results = _run_tasks(
+        {
+            "betweenness": (_betweenness_from_csr, (A, k, bet_epsilon)),
+            "eigenvector": (_eigenvector_from_csr, (A,)),
+            "community": (_communities_from_csr, (A,)),
+        },
+        parallel=parallel_min_nodes is not None and n_nodes >= parallel_min_nodes
+    )
+
+    # armar DataFrames (columnas como arrays tipados, en el orden de `nodes`)
+    labels = nx.get_node_attributes(G, "label")
+    columns = nx.get_node_attributes(G, "column")
+    nodes_df = pd.DataFrame({
+        "node_id": nodes,
+        "label": [labels.get(n) for n in nodes],
+        "column": [columns.get(n) for n in nodes],
+        "degree": degree,
+        "degree_weighted": degree_w,
+        "degree_centrality": degree_centrality,
+        "betweenness": results["betweenness"],
+        "eigenvector": results["eigenvector"],
+        "community": results["community"]
+    }).sort_values("degree_weighted", ascending=False)
 
     edges_data = [{"u": u, "v": v, "weight": d.get("weight", 1)} for u, v, d in G.edges(data=True)]
     edges_df = pd.DataFrame(edges_data).sort_values("weight", ascending=False)
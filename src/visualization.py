@@ -1,6 +1,6 @@
 # src/visualization.py
 """
-Visualización y utilidades para grafos con pyvis (actualizado para mostrar etiquetas visibles
+Visualización y utilidades para grafos con vis-network (actualizado para mostrar etiquetas visibles
 y permitir configurar color de fondo).
 
 Funciones principales:
@@ -8,27 +8,81 @@ Funciones principales:
 - pyvis_graph_to_html(G, nodes_df, out_path=..., max_nodes_to_show=..., show_labels=..., label_field=..., label_max_len=..., font_size=..., font_color=..., bgcolor=...)
 
 Notas:
-- Para que las etiquetas se vean, pyvis pasa la propiedad `label` al cliente (vis.js).
+- Para que las etiquetas se vean, se pasa la propiedad `label` al cliente (vis.js).
   Aquí truncamos etiquetas largas y además creamos un `title` HTML rico (tooltip) con las métricas.
 - Si el grafo es muy grande se filtra por top-K nodos (por degree_weighted) antes de generar el HTML.
+- El HTML se arma con una plantilla fija (string.Template) y el JSON de nodos/aristas de vis-network,
+  sin pasar por el pipeline Jinja de pyvis; con orjson instalado la serialización es más rápida.
 """
 
 import math
+import numpy as np
 import networkx as nx
-from pyvis.network import Network
 import pandas as pd
-import io
 import base64
+import json
+from string import Template
 from typing import Optional
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_HTML_TEMPLATE = Template("""<html>
+<head>
+<meta charset="utf-8">
+<link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/dist/vis-network.min.css" integrity="sha512-WgxfT5LWjfszlPHXRmBWHkV2eceiWTOBvrKCNbdgDYTHrT2AeLCGbF4sZlZw3UMN3WtL0tGUoIAKsu8mllg/XA==" crossorigin="anonymous" referrerpolicy="no-referrer" />
+<script src="https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/vis-network.min.js" integrity="sha512-LnvoEWDFrqGHlHmDD2101OrLcbsfkrzoSpvtSQtxK3RMnRV0eOkhhBN2dXHKRrUU8p2DGRTk35n4O8nWSVe1mQ==" crossorigin="anonymous" referrerpolicy="no-referrer"></script>
+<style type="text/css">
+  #mynetwork {
+    width: ${width};
+    height: ${height};
+    background-color: ${bgcolor};
+    border: 1px solid lightgray;
+    position: relative;
+    float: left;
+  }
+</style>
+</head>
+<body>
+<div id="mynetwork"></div>
+<script type="text/javascript">
+  var container = document.getElementById('mynetwork');
+  var nodes = new vis.DataSet(${nodes_json});
+  var edges = new vis.DataSet(${edges_json});
+  var options = ${options_json};
+  var network = new vis.Network(container, {nodes: nodes, edges: edges}, options);
+</script>
+</body>
+</html>
+""")
+
+
+def _json_default(obj):
+    # escalares numpy (p. ej. pesos np.int64) -> tipos nativos
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Tipo no serializable: {type(obj)!r}")
+
+
+def _to_json(obj) -> str:
+    """
+    Serializa a JSON (orjson si está disponible) apto para incrustar en un <script>.
+    """
+    if orjson is not None:
+        text = orjson.dumps(obj, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
+    else:
+        text = json.dumps(obj, default=_json_default)
+    # evitar que una etiqueta con "</script>" cierre el bloque de script
+    return text.replace("</", "<\\/")
+
 def dataframe_download_link(df: pd.DataFrame, filename: str = "data.csv") -> str:
     """
     Genera un link HTML para descargar un DataFrame como CSV (base64), útil en Streamlit.
+    Para datasets grandes preferir st.download_button (evita el data-URL y el +33% de base64).
     """
-    towrite = io.BytesIO()
-    df.to_csv(towrite, index=False)
-    towrite.seek(0)
-    b64 = base64.b64encode(towrite.read()).decode()
+    b64 = base64.b64encode(df.to_csv(index=False).encode("utf-8")).decode("ascii")
     href = f'<a href="data:file/csv;base64,{b64}" download="{filename}">Descargar {filename}</a>'
     return href
 
@@ -61,7 +115,7 @@ def pyvis_graph_to_html(
     bgcolor: str = "#ffffff"
 ) -> str:
     """
-    Crea un archivo HTML interactivo con pyvis y devuelve la ruta.
+    Crea un archivo HTML interactivo (vis-network) y devuelve la ruta.
 
     Parámetros destacados:
       - G: grafo networkx
@@ -71,122 +125,147 @@ def pyvis_graph_to_html(
       - show_labels: si True, fuerza a que cada nodo tenga una etiqueta visible (label)
       - label_field: campo en nodes_df (o en node attribute) que se usa para la etiqueta visible
       - label_max_len: máximo número de caracteres mostrados en la etiqueta (se trunca si es mayor)
-      - font_size, font_color: estilo de la etiqueta (se pasa a vis.js vía pyvis)
+      - font_size, font_color: estilo de la etiqueta (se pasa a vis.js)
       - physics: habilita/deshabilita simulación física
       - bgcolor: color de fondo para el HTML generado (ej. "#ffffff")
     """
-    # Preparar lookup desde nodes_df (si viene)
-    if nodes_df is None:
-        nodes_lookup = {}
-    else:
-        df = nodes_df.copy()
+    # Preparar lookups por columna desde nodes_df (si viene): un dict escalar por campo usado,
+    # y las líneas de métricas del tooltip ya formateadas en bloque
+    metric_names = ('degree_weighted', 'degree', 'degree_centrality', 'betweenness', 'eigenvector', 'community')
+    label_lookup, column_lookup, size_lookup, metrics_lookup = {}, {}, {}, {}
+    if nodes_df is not None:
+        df = nodes_df
         if 'node_id' not in df.columns:
             # intentar inferir índice o lanzar warning silencioso
             df = df.reset_index().rename(columns={df.index.name or 0: 'node_id'})
-        df['node_id'] = df['node_id'].astype(str)
-        nodes_lookup = df.set_index('node_id').to_dict('index')
+        df = df.set_index(df['node_id'].astype(str))
+        if label_field in df.columns:
+            label_lookup = df[label_field].to_dict()
+        if 'column' in df.columns:
+            column_lookup = df['column'].to_dict()
+        if 'degree_weighted' in df.columns:
+            sizes = (8 + np.sqrt(pd.to_numeric(df['degree_weighted'], errors='coerce')) * 3).clip(6, 36)
+            size_lookup = sizes.fillna(10).to_dict()
+        metric_lines = None
+        for metric in metric_names:
+            if metric not in df.columns:
+                continue
+            if pd.api.types.is_float_dtype(df[metric]):
+                vals = df[metric].map('{:.4f}'.format)
+            else:
+                vals = df[metric].map(lambda v: f"{v:.4f}" if isinstance(v, float) else str(v))
+            line = f"<br>{metric}: " + vals.astype(str)
+            metric_lines = line if metric_lines is None else metric_lines + line
+        if metric_lines is not None:
+            metrics_lookup = metric_lines.to_dict()
 
-    # Filtrado top-K si corresponde (por degree_weighted)
-    G_to_show = G
+    # Filtrado top-K si corresponde (por degree_weighted), sin materializar un subgrafo:
+    # solo se recorren una vez los nodos elegidos y sus aristas
+    node_items = list(G.nodes(data=True))
+    edge_items = G.edges(data='weight', default=1)
     if max_nodes_to_show and G.number_of_nodes() > max_nodes_to_show:
         if nodes_df is not None and 'degree_weighted' in nodes_df.columns:
             top_nodes = nodes_df.sort_values('degree_weighted', ascending=False).head(max_nodes_to_show)['node_id'].astype(str).tolist()
         else:
             degs = dict(G.degree(weight='weight'))
             top_nodes = sorted(degs, key=lambda x: degs.get(x, 0), reverse=True)[:max_nodes_to_show]
-        top_set = set(str(n) for n in top_nodes)
-        G_to_show = G.subgraph([n for n in G.nodes() if str(n) in top_set]).copy()
+        top_set = frozenset(str(n) for n in top_nodes)
+        node_items = [(n, d) for n, d in node_items if str(n) in top_set]
+        shown = [n for n, _ in node_items]
+        edge_items = [
+            (u, v, w) for u, v, w in G.edges(shown, data='weight', default=1)
+            if str(u) in top_set and str(v) in top_set
+        ]
 
     # Crear paleta simple por columnas si existen
-    column_list = list({(d.get('column') if d.get('column') is not None else 'UNKNOWN') for _, d in G_to_show.nodes(data=True)})
+    column_list = list({(d.get('column') if d.get('column') is not None else 'UNKNOWN') for _, d in node_items})
     default_colors = [
         '#e6194b','#3cb44b','#ffe119','#4363d8','#f58231','#911eb4','#46f0f0','#f032e6',
         '#bcf60c','#fabebe','#800000','#808000','#00FFFF','#008080','#000080','#800080'
     ]
     color_map = {col: default_colors[i % len(default_colors)] for i, col in enumerate(column_list)}
 
-    # Crear la red pyvis indicando bgcolor (fondo)
-    net = Network(height="800px", width="100%", notebook=True, bgcolor=bgcolor)
-    net.barnes_hut()
-    net.toggle_physics(physics)
-
-    # Añadir nodos con label (visible) y title (tooltip html)
-    for n, d in G_to_show.nodes(data=True):
+    # Nodos con label (visible) y title (tooltip html), como dicts de vis-network.
+    # font config: vis.js font dict
+    font = {"size": font_size, "color": font_color, "face": "Arial"}
+    node_map = {}
+    for n, d in node_items:
         node_id = str(n)
-        row = nodes_lookup.get(node_id, {})
+        if node_id in node_map:
+            continue
         # obtener etiqueta base: preferir label_field, sino atributo 'label', sino node_id
-        raw_label = row.get(label_field) or d.get('label') or node_id
+        raw_label = label_lookup.get(node_id) or d.get('label') or node_id
         label = _truncate_label(raw_label, max_len=label_max_len) if show_labels else None
 
-        # preparar title HTML con más información (tooltip)
-        title_lines = []
-        title_lines.append(f"<b>{raw_label}</b>")
-        col_val = row.get('column') or d.get('column')
-        if col_val:
-            title_lines.append(f"Columna: {col_val}")
-        for metric in ('degree_weighted', 'degree', 'degree_centrality', 'betweenness', 'eigenvector', 'community'):
-            if metric in row:
-                val = row.get(metric)
-                if isinstance(val, float):
-                    val = f"{val:.4f}"
-                title_lines.append(f"{metric}: {val}")
-        title_lines.append(f"node_id: {node_id}")
-        title_html = "<br>".join(title_lines)
+        # title HTML con más información (tooltip)
+        col_val = column_lookup.get(node_id) or d.get('column')
+        title_html = (
+            f"<b>{raw_label}</b>"
+            + (f"<br>Columna: {col_val}" if col_val else "")
+            + metrics_lookup.get(node_id, "")
+            + f"<br>node_id: {node_id}"
+        )
 
         # color por columna
-        col = row.get('column') or d.get('column') or 'UNKNOWN'
-        color = color_map.get(col, "#888888")
-
-        # font config: vis.js font dict
-        font = {"size": font_size, "color": font_color, "face": "Arial"}
+        color = color_map.get(col_val or 'UNKNOWN', "#888888")
 
         # tamaño de nodo proporcional al degree_weighted si está disponible
-        size = 10
-        try:
-            size = 8 + math.sqrt(float(row.get('degree_weighted', d.get('weight', 0) or 0))) * 3
-            size = max(6, min(size, 36))
-        except Exception:
-            size = 10
-
-        net.add_node(
-            node_id,
-            label=label,
-            title=title_html,
-            color=color,
-            size=size,
-            font=font
-        )
+        size = size_lookup.get(node_id)
+        if size is None:
+            try:
+                size = 8 + math.sqrt(float(d.get('weight', 0) or 0)) * 3
+                size = max(6, min(size, 36))
+            except Exception:
+                size = 10
+
+        node_map[node_id] = {
+            "id": node_id,
+            "label": label or node_id,
+            "shape": "dot",
+            "title": title_html,
+            "color": color,
+            "size": size,
+            "font": font
+        }
 
-    # Añadir aristas con peso y títulos
-    for u, v, ed in G_to_show.edges(data=True):
-        w = ed.get('weight', 1)
-        net.add_edge(str(u), str(v), value=w, title=f"weight: {w}")
+    # Aristas con peso y títulos (G es simple: no hay aristas repetidas)
+    edges = [
+        {"from": str(u), "to": str(v), "value": w, "title": f"weight: {w}"}
+        for u, v, w in edge_items
+    ]
 
     # Opciones visuales globales para vis.js
-    options = f"""
-    var options = {{
-      "nodes": {{
-        "borderWidth": 1,
-        "shadow": true
-      }},
-      "interaction": {{
-        "hover": true,
-        "tooltipDelay": 100
-      }},
-      "physics": {{
-        "barnesHut": {{
-          "gravitationalConstant": -8000,
-          "centralGravity": 0.3,
-          "springLength": 95,
-          "springConstant": 0.04,
-          "damping": 0.09
-        }},
-        "minVelocity": 0.75
-      }}
-    }}
-    """
-    net.set_options(options)
+    options = {
+        "nodes": {
+            "borderWidth": 1,
+            "shadow": True
+        },
+        "interaction": {
+            "hover": True,
+            "tooltipDelay": 100
+        },
+        "physics": {
+            "enabled": bool(physics),
+            "barnesHut": {
+                "gravitationalConstant": -8000,
+                "centralGravity": 0.3,
+                "springLength": 95,
+                "springConstant": 0.04,
+                "damping": 0.09
+            },
+            "minVelocity": 0.75
+        }
+    }
 
     # Guardar archivo HTML
-    net.show(out_path)
+    html = _HTML_TEMPLATE.substitute(
+        width="100%",
+        height="800px",
+        bgcolor=bgcolor,
+        nodes_json=_to_json(list(node_map.values())),
+        edges_json=_to_json(edges),
+        options_json=_to_json(options)
+    )
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write(html)
     return out_path
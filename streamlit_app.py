@@ -6,7 +6,7 @@ App Streamlit principal. Interactúa con los módulos en /src para:
 - generar gráficos con Plotly
 - construir un grafo (co-ocurrencias)
 - calcular métricas optimizadas
-- visualizar pyvis embebido y descargar resultados
+- visualizar el grafo (vis-network) embebido y descargar resultados
 """
 
 import os
@@ -22,7 +22,7 @@ from streamlit.components.v1 import html as st_html
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), "src"))
 
-from data_loader import load_csv_smart
+from data_loader import load_csv_smart, to_categoricals
 from graph_builder import build_cooccurrence_graph
 from metrics import compute_graph_metrics
 from visualization import pyvis_graph_to_html, dataframe_download_link
@@ -30,6 +30,48 @@ from utils import ensure_dir
 
 st.set_page_config(layout="wide", page_title="Explorador de Grafos")
 
+def is_text_col(s: pd.Series) -> bool:
+    """Columna de texto: object, string o category (ver to_categoricals)."""
+    return s.dtype == "object" or isinstance(s.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(s.dtype)
+
+# Cache de los cómputos costosos: Streamlit re-ejecuta el script en cada interacción.
+# max_entries acota la memoria: solo se guardan las últimas combinaciones usadas.
+@st.cache_data(show_spinner=False, max_entries=2)
+def cached_load_csv(source, mtime=None):
+    """
+    Lee el CSV una sola vez por contenido (bytes subidos) o por ruta + mtime.
+    Devuelve (df, summary): summary tiene nunique e is_text por columna, calculados
+    una vez para no re-escanear las columnas en cada re-ejecución.
+    """
+    df = to_categoricals(load_csv_smart(source))
+    summary = pd.DataFrame({
+        "nunique": df.nunique(dropna=True),
+        "is_text": [is_text_col(df[c]) for c in df.columns],
+    }, index=df.columns)
+    return df, summary
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def cached_csv_bytes(df: pd.DataFrame) -> bytes:
+    return df.to_csv(index=False).encode("utf-8")
+
+def frame_key(df: pd.DataFrame, cols) -> tuple:
+    """Clave barata para identificar el contenido de df[cols] entre re-ejecuciones."""
+    return (tuple(cols), len(df), int(pd.util.hash_pandas_object(df[list(cols)], index=False).sum()))
+
+@st.cache_resource(show_spinner=False, max_entries=3)
+def cached_graph(key: tuple, _df: pd.DataFrame):
+    # el grafo es un recurso (no se serializa); key identifica df + columnas
+    return build_cooccurrence_graph(_df, list(key[0]))
+
+@st.cache_data(show_spinner=False, max_entries=3)
+def cached_metrics(key: tuple, _G, approx_betweenness: bool, max_nodes_for_exact: int):
+    return compute_graph_metrics(
+        _G,
+        approx_betweenness=approx_betweenness,
+        bet_k=None,          # None => auto
+        max_nodes_for_exact=max_nodes_for_exact
+    )
+
 st.title("Exploración y visualización interactiva de grafos")
 
 # Sidebar - carga
@@ -39,19 +81,19 @@ use_example = st.sidebar.checkbox("Usar dataset de ejemplo (si existe vf.csv loc
 
 if uploaded is not None:
     try:
-        df = load_csv_smart(uploaded)
+        df, summary = cached_load_csv(uploaded.getvalue())
     except Exception as e:
         st.sidebar.error(f"Error al leer el CSV subido: {e}")
         st.stop()
 elif use_example and os.path.exists("vf.csv"):
-    df = load_csv_smart("vf.csv")
+    df, summary = cached_load_csv("vf.csv", mtime=os.path.getmtime("vf.csv"))
 else:
     st.sidebar.info("Subí un CSV o activa 'Usar dataset de ejemplo' con vf.csv en el repo.")
     st.stop()
 
 st.sidebar.markdown("---")
 st.sidebar.header("Export/Descarga")
-st.sidebar.markdown(dataframe_download_link(df, "original.csv"), unsafe_allow_html=True)
+st.sidebar.download_button("Descargar original.csv", data=cached_csv_bytes(df), file_name="original.csv", mime="text/csv")
 
 # Main layout: left data + right controls/preview
 left_col, right_col = st.columns([2, 1])
@@ -64,22 +106,22 @@ with left_col:
 with right_col:
     st.subheader("Selección rápida de columnas")
     # columnas categóricas candidate
-    cat_cols = [c for c in df.columns if df[c].dtype == "object" or df[c].nunique() < 200]
+    cat_cols = summary.index[summary["is_text"] | (summary["nunique"] < 200)].tolist()
     st.write("Columnas candidatas (categóricas/baja cardinalidad):")
     st.write(cat_cols[:50])
 
 st.markdown("---")
 st.header("1) Filtros dinámicos")
 
-# Generar filtros automáticos para columnas que convienen (object o pocos valores)
-filter_cols = [c for c in df.columns if (df[c].dtype == "object" and df[c].nunique() <= 200)]
-filter_cols += [c for c in df.columns if df[c].dtype != "object" and df[c].nunique() <= 20]
+# Generar filtros automáticos para columnas que convienen (texto/category o pocos valores)
+filter_cols = summary.index[summary["is_text"] & (summary["nunique"] <= 200)].tolist()
+filter_cols += summary.index[~summary["is_text"] & (summary["nunique"] <= 20)].tolist()
 filter_cols = sorted(list(set(filter_cols)))
 
 st.sidebar.header("Filtros dinámicos")
 active_filters = {}
 for c in filter_cols:
-    if df[c].dtype == "object":
+    if summary.loc[c, "is_text"]:
         vals = list(df[c].dropna().unique())
         sel = st.sidebar.multiselect(f"{c}", options=sorted(vals), default=vals[:5])
         if sel:
@@ -99,7 +141,7 @@ for c, vals in active_filters.items():
 st.markdown(f"Dataset filtrado: {df_filtered.shape[0]} filas")
 
 # Download filtered
-st.markdown(dataframe_download_link(df_filtered, "filtered.csv"), unsafe_allow_html=True)
+st.download_button("Descargar filtered.csv", data=cached_csv_bytes(df_filtered), file_name="filtered.csv", mime="text/csv")
 
 st.markdown("---")
 st.header("2) Generador de gráficos interactivos")
@@ -153,7 +195,7 @@ st.header("3) Construir grafo (co-ocurrencias) y analizar")
 
 st.info("Seleccioná columnas categóricas (o de baja cardinalidad) para construir nodos. Nodo = 'col::valor'.")
 
-default_choices = [c for c in df.columns if df[c].dtype == "object"][:3]
+default_choices = summary.index[summary["is_text"]].tolist()[:3]
 selected_cols = st.multiselect("Columnas para nodos", options=list(df.columns), default=default_choices)
 
 col1, col2 = st.columns([1,1])
@@ -167,17 +209,13 @@ if st.button("Construir y analizar grafo"):
         st.error("Seleccioná al menos una columna para construir el grafo.")
     else:
         with st.spinner("Construyendo grafo..."):
-            G = build_cooccurrence_graph(df_filtered, selected_cols)
+            graph_key = frame_key(df_filtered, selected_cols)
+            G = cached_graph(graph_key, df_filtered)
         st.success(f"Grafo construido: {G.number_of_nodes()} nodos, {G.number_of_edges()} aristas")
 
         # Calcular métricas (óptimas)
         st.info("Calculando métricas (puede tardar según tamaño).")
-        nodes_df, edges_df = compute_graph_metrics(
-            G,
-            approx_betweenness=use_approx,
-            bet_k=None,          # None => auto
-            max_nodes_for_exact=2000
-        )
+        nodes_df, edges_df = cached_metrics(graph_key, G, use_approx, 2000)
         st.write("Top nodos (por degree_weighted):")
         st.dataframe(nodes_df.head(20))
 
@@ -190,8 +228,8 @@ if st.button("Construir y analizar grafo"):
         st.sidebar.markdown(dataframe_download_link(nodes_df, "nodes_metrics.csv"), unsafe_allow_html=True)
         st.sidebar.markdown(dataframe_download_link(edges_df, "edges_metrics.csv"), unsafe_allow_html=True)
 
-        # Visualizar con pyvis (guardar graph.html)
-        st.info("Generando visualización interactiva (pyvis)...")
+        # Visualizar con vis-network (guardar graph.html)
+        st.info("Generando visualización interactiva (vis-network)...")
         html_path = os.path.join(out_dir, "graph.html")
         pyvis_graph_to_html(G, nodes_df, html_path, max_nodes_to_show=max_nodes_filter)
         st.success(f"graph.html creado: {html_path}")